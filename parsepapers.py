@@ -1,105 +1,162 @@
 import argparse
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from functools import lru_cache, partial
 import json
 from pathlib import Path
-from pprint import pprint
 import logging
+import os
 import re
+import tempfile
+import threading
 import tomllib  # 3.11
 
-from jinja2 import Environment, PackageLoader, select_autoescape
-from requests import Session
-from requests_cache import CachedSession, CacheMixin
-from requests_ratelimiter import LimiterMixin
+from jinja2 import (
+    Environment,
+    FileSystemBytecodeCache,
+    PackageLoader,
+    select_autoescape,
+)
+from requests_cache import CachedSession
+from requests_ratelimiter import LimiterAdapter
 
 from read_input import read_file
 
-
-class CachedLimiterSession(CacheMixin, LimiterMixin, Session):
-    """Session class with caching and rate-limiting behavior. Accepts
-    arguments for both LimiterSession and CachedSession.
+# Number of concurrent queries; crossref's polite pool allows a few
+# concurrent requests, pubmed requests are throttled separately
+MAX_WORKERS = 3
+
+# Serializes messages printed from worker threads, see _print
+_print_lock = threading.Lock()
+
+# Number of ids sent in one Pubmed Literature Citation Exporter request
+CTXP_CHUNK_SIZE = 50
+
+
+# Identifier patterns for citation text. Identifiers are expected to
+# be preceded by either of: "PMID:", "DOI:", "doi.org/", "PMCID:", with
+# space after colon being optional. DOI regex uses a negative
+# lookbehind to avoid capturing trailing punctuation, and allows any
+# characters in the suffix; it keeps unicode \S, so that e.g. a
+# non-breaking space ends the suffix
+_ID_PATTERNS = {
+    "pmid": re.compile(r"PMID: ?(\d+)", re.ASCII),
+    "doi": re.compile(r"(?:doi: ?|doi.org/)(10\.[\d.]+/\S+)(?<![\.,;])"),
+    "pmcid": re.compile(r"PMCID: ?(PMC\d+)", re.ASCII),
+}
+
+# Literal substrings that a match requires, checked before the regex
+_ID_GATES = {"pmid": "PMID", "doi": "10.", "pmcid": "PMCID"}
+
+# Per-publisher doi patterns for content urls. Journal links often
+# include an identifier in their components, but url patterns differ.
+# Although the patterns are very similar between publishers, there are
+# differences in the number of components that are parts of the doi
+# suffix versus parts of journal-specific url (a suffix can contain
+# slashes) - compare oup and mit press for example. To avoid spurious
+# matches, patterns are per-publisher. Only biorxiv doi pattern is
+# based on their FAQ, others were created by inspecting several
+# available URLs
+_DOI_URL_PATTERNS = (
+    r"biorxiv\.org/content/(10\.\d{4,6}/\d{6})",  # biorxiv pre 2019-10-11
+    r"biorxiv\.org/content/(10\.\d{4,6}/\d{4}\.\d{2}\.\d{2}\.\d{6})",  # biorxiv
+    r"medrxiv\.org/content/(10\.\d{4,6}/\d{4}\.\d{2}\.\d{2}\.\d{8})",  # medrxiv
+    r"link\.springer\.com/(?:content|article)(?:/pdf)?/(10\.\d+/s[\d\-]+)",  # springer
+    r"onlinelibrary\.wiley\.com/doi(?:/e?pdf|/epub|/full)?/(10\.\d+/[a-z]+\.\d+)",  # wiley
+    r"embopress\.org/doi(?:/e?pdf|/epub|/full)?/(10\.\d+/[a-z]+\.\d+)",  # embo press
+    r"science\.org/doi(?:/e?pdf|/epub|/full)?/(10\.\d+/[a-z]+\.\w+)",  # science
+    r"sagepub\.com/doi(?:/e?pdf|/epub|/full)?/(10\.\d+/\d+)",  # sage
+    r"academic\.oup\.com/\w+/[\w\-]+/doi/(10\.\d+/\w+/\w+)",  # oup
+    r"direct.mit.edu/\w+/[\w\-]+/doi/(10\.\d+/\w+)",  # mit press
+    r"ahajournals\.org/doi(?:/e?pdf|/epub|/full)?/(10\.\d+/\w+\.\d+\.\d+)",  # aha
+    r"frontiersin\.org/articles/(10\.\d+/\w+\.\d+\.\d+)",  # frontiers
+    r"pubs\.acs\.org/doi/(10\.\d+/\w+\.\w+(?:\.\w+)?)",  # acs
+)
+
+# Identifier patterns for content urls, doi patterns merged into one
+# alternation. Urls are ascii, so \d and \w need not consult unicode
+# tables
+_URL_PATTERNS = {
+    "doi": re.compile("|".join(_DOI_URL_PATTERNS), re.ASCII),
+    "pmcid": re.compile(r"ncbi\.nlm\.nih\.gov/pmc/articles/PMC(\d+)", re.ASCII),
+    "pmid": re.compile(r"pubmed\.ncbi\.nlm\.nih\.gov/(\d+)", re.ASCII),
+}
+
+# Literal substrings that a url match requires, checked before the regex
+_URL_GATES = {
+    "doi": "10.",
+    "pmcid": "ncbi.nlm.nih.gov/pmc/articles/PMC",
+    "pmid": "pubmed.ncbi.nlm.nih.gov/",
+}
+
+
+def _named_alternation(patterns):
+    """Join compiled patterns into one regex, with a named group per key
+
+    Each named group sits in a lookahead, so matches are zero-width
+    and finditer also finds matches that overlap an earlier one (e.g.
+    a PMID swallowed by a greedy doi suffix). The ascii flag of each
+    pattern is kept as a scoped inline flag.
 
     """
+    branches = []
+    for name, pat in patterns.items():
+        flags = "a" if pat.flags & re.ASCII else ""
+        branches.append(f"(?=(?P<{name}>(?{flags}:{pat.pattern})))")
+    return re.compile("|".join(branches))
 
-    pass
 
+# Citation and url patterns of all identifier types merged into one
+# regex each, so that get_identifiers scans each text once
+_CITATION_IDS = _named_alternation(_ID_PATTERNS)
+_URL_IDS = _named_alternation(_URL_PATTERNS)
 
-def find_id(citation_text, idtype="pmid"):
-    """Find an identifier in a citation text
 
-    Uses regular expressions to find a matching identifier. Expects
-    identifiers to be preceded by either of: "PMID:", "DOI:",
-    "doi.org/", "PMCID:", with space after colon being optional. DOI
-    regex uses a negative lookbehind to avoid capturing trailing
-    punctuation, and allows any characters in the suffix.
+_ID_TYPES = ("doi", "pmid", "pmcid")
 
-    """
-    patterns = {
-        "pmid": r"PMID: ?(\d+)",
-        "doi": r"(?:doi: ?|doi.org/)(10\.[\d.]+/\S+)(?<![\.,;])",
-        "pmcid": r"PMCID: ?(PMC\d+)",
-    }
 
-    pat = patterns[idtype.lower()]
-    m = re.search(pat, citation_text)
-    return m.group(1) if m is not None else m
+@lru_cache(maxsize=4096)
+def _scan_identifiers(citation, url):
+    """Find identifiers in citation and/or url, as a tuple
 
+    Citation and url are each scanned once, for all identifier types
+    at the same time, and only if they contain a literal required by
+    a missing type. The first match of each type is used; the match
+    type is given by the name of the outer group, and the identifier
+    by the first inner group that matched. Results are memoized, the
+    tuple is ordered as _ID_TYPES.
 
-def id_from_url(s, idtype):
-    """Find an identifier in a URL
+    """
+    identifiers = dict.fromkeys(_ID_TYPES)
+    # prefer "canonical" form included in citation, fall back to url patterns
+    for text, pat, gates in (
+        (citation, _CITATION_IDS, _ID_GATES),
+        (url, _URL_IDS, _URL_GATES),
+    ):
+        if text is None or not any(
+            gates[k] in text for k, v in identifiers.items() if v is None
+        ):
+            # cheap substring test, skips the regex for most misses
+            continue
+        for m in pat.finditer(text):
+            if identifiers[m.lastgroup] is None:
+                identifiers[m.lastgroup] = next(
+                    g for g in m.groups()[m.lastindex :] if g is not None
+                )
+                if None not in identifiers.values():
+                    break
+    return tuple(identifiers.values())
 
-    Journal links often include an identifier (doi, pmid, pmcid) in
-    their components, but url patterns differ. This function tries to
-    match patterns for several known publishers, as well as pubmed and
-    pubmed central.
 
-    Although the patterns are very similar between publishers, there
-    are differences in the number of components that are parts of the
-    doi suffix versus parts of journal-specific url (a suffix can
-    contain slashes) - compare oup and mit press for example. To avoid
-    spurious matches, patterns are per-publisher.
+def get_identifiers(entry):
+    """Find identifiers in citation and/or url
 
-    Only biorxiv doi pattern is based on their FAQ, others were
-    created by inspecting several available URLs. Pubmed (central)
-    seems the most obvious.
+    Returns a new dict with doi, pmid and pmcid keys (None if not
+    found) for every call, see _scan_identifiers.
 
     """
-    patterns = {
-        "doi": [
-            r"biorxiv\.org/content/(10\.\d{4,6}/\d{6})",  # biorxiv pre 2019-10-11
-            r"biorxiv\.org/content/(10\.\d{4,6}/\d{4}\.\d{2}\.\d{2}\.\d{6})",  # biorxiv
-            r"medrxiv\.org/content/(10\.\d{4,6}/\d{4}\.\d{2}\.\d{2}\.\d{8})",  # medrxiv
-            r"link\.springer\.com/(?:content|article)(?:/pdf)?/(10\.\d+/s[\d\-]+)",  # springer
-            r"onlinelibrary\.wiley\.com/doi(?:/e?pdf|/epub|/full)?/(10\.\d+/[a-z]+\.\d+)",  # wiley
-            r"embopress\.org/doi(?:/e?pdf|/epub|/full)?/(10\.\d+/[a-z]+\.\d+)",  # embo press
-            r"science\.org/doi(?:/e?pdf|/epub|/full)?/(10\.\d+/[a-z]+\.\w+)",  # science
-            r"sagepub\.com/doi(?:/e?pdf|/epub|/full)?/(10\.\d+/\d+)",  # sage
-            r"academic\.oup\.com/\w+/[\w\-]+/doi/(10\.\d+/\w+/\w+)",  # oup
-            r"direct.mit.edu/\w+/[\w\-]+/doi/(10\.\d+/\w+)",  # mit press
-            r"ahajournals\.org/doi(?:/e?pdf|/epub|/full)?/(10\.\d+/\w+\.\d+\.\d+)",  # aha
-            r"frontiersin\.org/articles/(10\.\d+/\w+\.\d+\.\d+)",  # frontiers
-            r"pubs\.acs\.org/doi/(10\.\d+/\w+\.\w+(?:\.\w+)?)",  # acs
-        ],
-        "pmcid": [r"ncbi\.nlm\.nih\.gov/pmc/articles/PMC(\d+)"],
-        "pmid": [r"pubmed\.ncbi\.nlm\.nih\.gov/(\d+)"],
-    }
-
-    for pat in patterns[idtype.lower()]:
-        m = re.search(pat, s)
-        if m is not None:
-            return m.group(1)
-
-
-def get_identifiers(entry):
-    """Find identifiers in citation and/or url"""
-    identifiers = {}
-    for id_ in ("doi", "pmid", "pmcid"):
-        # prefer "canonical" form included in citation
-        identifiers[id_] = find_id(entry.citation, id_)
-        if identifiers[id_] is None:
-            # fall back to url patterns
-            identifiers[id_] = id_from_url(entry.url, id_)
-    return identifiers
+    return dict(zip(_ID_TYPES, _scan_identifiers(entry.citation, entry.url)))
 
 
 def query_pubmed_ctxp(session, id_, db):
@@ -124,6 +181,59 @@ def query_pubmed_ctxp(session, id_, db):
         return r.json()
 
 
+def query_pubmed_ctxp_batch(session, ids, db, chunk_size=CTXP_CHUNK_SIZE):
+    """Query Pubmed Literature Citation Exporter for many ids at once
+
+    Like query_pubmed_ctxp, but sends the ids in chunks, with one
+    request per chunk (the exporter accepts a repeated id
+    parameter). Ids missing from a batch response are retried with
+    query_pubmed_ctxp. Returns a dict mapping the requested ids to
+    CSL json; ids for which no record was returned are left out.
+
+    See https://api.ncbi.nlm.nih.gov/lit/ctxp/
+
+    """
+    # records carry PMID / PMCID fields, url-derived pmcids lack "PMC";
+    # keep every spelling of an id, all of them map to the same record
+    key = "PMID" if db.lower() == "pubmed" else "PMCID"
+    wanted = defaultdict(list)
+    for id_ in ids:
+        spellings = wanted[str(id_).removeprefix("PMC")]
+        if id_ not in spellings:
+            spellings.append(id_)
+    keys = list(wanted)
+
+    records = {}
+    for i in range(0, len(keys), chunk_size):
+        r = session.get(
+            url=f"https://api.ncbi.nlm.nih.gov/lit/ctxp/v1/{db.lower()}/",
+            headers={"user-agent": "sfbPublicationParser/0.1"},
+            params={
+                "format": "csl",
+                "contenttype": "json",
+                "id": [wanted[k][0] for k in keys[i : i + chunk_size]],
+            },
+        )
+        if not r.ok:
+            continue
+        rj = r.json()
+        # a single record is not wrapped in a list
+        for record in rj if isinstance(rj, list) else [rj]:
+            k = str(record.get(key, "")).removeprefix("PMC")
+            if k in wanted:
+                records[k] = record
+
+    # ids missing from batch responses (e.g. a failed chunk) are queried
+    # one by one, so that a single bad id does not lose the whole chunk
+    for k in keys:
+        if k not in records:
+            record = query_pubmed_ctxp(session, wanted[k][0], db)
+            if record is not None:
+                records[k] = record
+
+    return {id_: records[k] for k in records for id_ in wanted[k]}
+
+
 def query_pubmed_idconv(session, id_, email):
     """Query Pubmed ID Converter API
 
@@ -178,7 +288,13 @@ def query_crossref(session, doi, email):
         return r.json().get("message")
 
 
-def check_ratings(items, close=0.75, almost=0.9):
+def _print(*args):
+    """Print a message, without mixing it with output of other threads"""
+    with _print_lock:
+        print(*args)
+
+
+def check_ratings(items, close=0.75, almost=0.9, label=None):
     """Print warning if ratings are close, return one item
 
     If two ratings are almost the same, but the first item is a
@@ -189,36 +305,47 @@ def check_ratings(items, close=0.75, almost=0.9):
 
     Otherwise, returns the first (i.e. higher-rated) item.
 
+    If given, label (e.g. the queried citation) starts every printed
+    message, so that they can be told apart when queries run in
+    parallel.
+
     """
-    if len(items) < 2:
-        return items[0]
-
-    scores = tuple(item["score"] for item in items)
-    similarity = scores[1] / scores[0]
-
-    if similarity > close:
-        print(
-            f"Bibliographic query: similar scores ({round(similarity, 2)})",
-            "for",
-            items[0].get("title")[0],
-            "and",
-            items[1].get("title")[0],
-        )
-        if items[0]["type"] == "peer-review":
-            print("The former is a peer review, discarding")
-            return check_ratings(items[1:], close, almost)
-    if (
-        similarity >= almost
-        and items[0].get("subtype") == "preprint"
-        and items[1].get("type") == "journal-article"
-    ):
-        print("The former is a preprint, taking the latter as it is a journal article")
-        return items[1]
-    return items[0]
+    prefix = "" if label is None else f"{label}: "
+    i = 0
+    while i < len(items) - 1:
+        first, second = items[i], items[i + 1]
+        similarity = second["score"] / first["score"]
+
+        if similarity > close:
+            _print(
+                f"{prefix}Bibliographic query: similar scores"
+                f" ({round(similarity, 2)}) for {first.get('title')[0]}"
+                f" and {second.get('title')[0]}"
+            )
+            if first["type"] == "peer-review":
+                _print(f"{prefix}The former is a peer review, discarding")
+                i += 1
+                continue
+        if (
+            similarity >= almost
+            and first.get("subtype") == "preprint"
+            and second.get("type") == "journal-article"
+        ):
+            _print(
+                f"{prefix}The former is a preprint,"
+                " taking the latter as it is a journal article"
+            )
+            return second
+        break
+    return items[i]
+
 
+def query_crossref_bibliographic(session, citation, email, label=None):
+    """Perform bibliographic query in crossref api
 
-def query_crossref_bibliographic(session, citation, email):
-    """Perform bibliographic query in crossref api"""
+    The label is passed on to check_ratings.
+
+    """
 
     payload = {
         "mailto": email,
@@ -233,7 +360,7 @@ def query_crossref_bibliographic(session, citation, email):
 
     if r.ok:
         items = r.json().get("message").get("items")
-        best = check_ratings(items)
+        best = check_ratings(items, label=label)
         return best
 
 
@@ -261,6 +388,59 @@ def query_doi_org(session, doi, useragent=None):
         return r.json()
 
 
+@lru_cache(maxsize=1)
+def get_environment():
+    """Return the Jinja environment
+
+    The environment is created once per process. Compiled bytecode is
+    cached on disk (in a per-user temporary directory), so that later
+    runs can skip parsing the template. The template expects an "sfb"
+    test (true for names of SFB authors) to be registered by the
+    caller in env.tests.
+
+    """
+    return Environment(
+        loader=PackageLoader("parsepapers"),
+        autoescape=select_autoescape(),
+        trim_blocks=True,
+        lstrip_blocks=True,
+        bytecode_cache=FileSystemBytecodeCache(),
+    )
+
+
+def get_template():
+    """Return the compiled html template, see get_environment"""
+    # the environment keeps loaded templates in its own cache
+    return get_environment().get_template("template.html")
+
+
+def resolve_entry(entry, identifiers, handlers, session, email, useragent):
+    """Retrieve metadata for a single entry
+
+    Handlers is a sequence of (idtype, function) pairs, in order of
+    priority; the function for the first identifier found in the
+    entry is called with that identifier and should return CSL json.
+    If no identifier is found, a bibliographic query is made with the
+    citation text. Returns CSL json, or None if metadata could not be
+    retrieved.
+
+    """
+    # entries are resolved in parallel, so name the entry in messages
+    label = entry.citation[:50] + "..."
+
+    for idtype, handler in handlers:
+        if (id_ := identifiers[idtype]) is not None:
+            _print(f"{label}: using {idtype}: {id_}")
+            return handler(id_)
+
+    _print(f"{label}: performing bibliographic query")
+    bib_res = query_crossref_bibliographic(session, entry, email, label)
+    # make another query, avoid translating crossref-api-message
+    if bib_res is not None and bib_res.get("DOI") is not None:
+        _print(f"{label}: using doi: {bib_res.get('DOI')} from bibliographic")
+        return query_doi_org(session, bib_res.get("DOI"), useragent)
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("infile", type=Path)
@@ -272,9 +452,10 @@ if __name__ == "__main__":
     raw_data = read_file(args.infile)
 
     # Read authors who are SFB authors, and should be displayed in bold
-    # For now, just a set of last names
+    # For now, just a set of last names, matched with the "sfb" template test
     authors_file = Path("sfb_authors.txt")
-    sfb_authors = set(authors_file.read_text().rstrip().split("\n"))
+    sfb_authors = frozenset(authors_file.read_text().splitlines())
+    get_environment().tests["sfb"] = sfb_authors.__contains__
 
     # For some APIs, an e-mail is required to be polite
     with Path("userconfig.toml").open("rb") as f:
@@ -288,49 +469,86 @@ if __name__ == "__main__":
     comment = f"https://github.com/sfb1451/publication-parser; mailto: {email}"
     useragent = f"{appname}/{appver} ({comment})"
 
-    # Have two cached requests session, one additionally throttled
-    # pubmed suggests throttling to max 3 per second, crossref can take more
-    throttled_session = CachedLimiterSession(cache_name="pubmed_cache", per_second=3)
-    session = CachedSession("query_cache")
+    # Have one cached requests session for all APIs; responses are
+    # reused for a month, or longer if a refresh fails. Identifier
+    # lookups change rarely and are kept longer, crossref bibliographic
+    # search results (works/?query...) can change as records are added.
+    # Cache-Control headers sent by the APIs take precedence. WAL
+    # journaling avoids an fsync on every cached response. NCBI suggests
+    # throttling to max 3 per second, so its hosts share one limiter;
+    # crossref can take more. Cache hits do not count towards the limit
+    session = CachedSession(
+        "query_cache",
+        expire_after=timedelta(days=30),
+        urls_expire_after={
+            "api.crossref.org/works/[?]": timedelta(days=7),
+            "api.ncbi.nlm.nih.gov": timedelta(days=90),
+            "doi.org": timedelta(days=90),
+        },
+        cache_control=True,
+        stale_if_error=True,
+        wal=True,
+    )
+    ncbi_adapter = LimiterAdapter(per_second=3, per_host=False)
+    session.mount("https://api.ncbi.nlm.nih.gov/", ncbi_adapter)
+    session.mount("https://www.ncbi.nlm.nih.gov/", ncbi_adapter)
+
+    flat_entries = [
+        (project, entry) for project, entries in raw_data.items() for entry in entries
+    ]
+    all_identifiers = []
+    for _, entry in flat_entries:
+        print("Processing", entry.citation[:50] + "...")
+        all_identifiers.append(get_identifiers(entry))
+
+    # Pubmed accepts many ids per request, so collect the ids that will
+    # be used (pmid takes priority over pmcid) and query them in batches
+    pmid_batch = [i["pmid"] for i in all_identifiers if i["pmid"] is not None]
+    pmcid_batch = [
+        i["pmcid"]
+        for i in all_identifiers
+        if i["pmid"] is None and i["pmcid"] is not None
+    ]
+    pubmed_records = {
+        "pubmed": query_pubmed_ctxp_batch(session, pmid_batch, "pubmed"),
+        "pmc": query_pubmed_ctxp_batch(session, pmcid_batch, "pmc"),
+    }
+
+    # Identifier types in order of priority: pmid, pmcid, doi, each
+    # with a function that returns CSL json for an identifier
+    handlers = (
+        ("pmid", pubmed_records["pubmed"].get),
+        ("pmcid", pubmed_records["pmc"].get),
+        ("doi", partial(query_doi_org, session, useragent=useragent)),
+    )
+
+    # Remaining entries are independent, so their queries can run
+    # concurrently; results come back in input order
+    resolve = partial(
+        resolve_entry,
+        handlers=handlers,
+        session=session,
+        email=email,
+        useragent=useragent,
+    )
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        results = executor.map(
+            resolve, (entry for _, entry in flat_entries), all_identifiers
+        )
 
     publications = defaultdict(list)
     unidentified = []
 
-    for project, entries in raw_data.items():
-        for entry in entries:
-            print("Processing", entry.citation[:50] + "...")
-            identifiers = get_identifiers(entry)
-
-            if (pmid := identifiers["pmid"]) is not None:
-                print("using pmid:", pmid)
-                res = query_pubmed_ctxp(throttled_session, pmid, "pubmed")
-
-            elif (pmcid := identifiers["pmcid"]) is not None:
-                print("using pmcid", pmcid)
-                res = query_pubmed_ctxp(throttled_session, pmcid, "pmc")
-
-            elif (doi := identifiers["doi"]) is not None:
-                print("using doi:", doi)
-                res = query_doi_org(session, doi, useragent)
-
-            else:
-                print("Performing bibliographic query")
-                bib_res = query_crossref_bibliographic(session, entry, email)
-                # make another query, avoid translating crossref-api-message
-                if bib_res is not None and bib_res.get("DOI") is not None:
-                    print(f"using doi: {bib_res.get('DOI')} from bibliographic")
-                    res = query_doi_org(session, bib_res.get("DOI"), useragent)
-                else:
-                    res = None
-
-            if res is None:
-                logging.warning("Cound not retrieve metadata (!)")
-                unidentified.append(entry)
-                continue
+    for (project, entry), res in zip(flat_entries, results):
+        if res is None:
+            logging.warning("Cound not retrieve metadata (!)")
+            unidentified.append(entry)
+            continue
 
-            print("Got", res.get("title"))
-            res["sfb_comment"] = entry.comment
-            publications[project].append(res)
+        print("Got", res.get("title"))
+        # copy, batch records are shared between entries with the same id
+        res = dict(res, sfb_comment=entry.comment)
+        publications[project].append(res)
 
     # Report on things we could not identify, if any
     if len(unidentified) > 0:
@@ -343,13 +561,18 @@ if __name__ == "__main__":
         json.dump(publications, jf)
 
     # Jinja
-    env = Environment(
-        loader=PackageLoader("parsepapers"),
-        autoescape=select_autoescape(),
-        trim_blocks=True,
-        lstrip_blocks=True,
-    )
-    template = env.get_template("template.html")
-    Path("publications.html").write_text(
-        template.render(pubdata=publications, sfb_authors=sfb_authors)
-    )
+    # write rendered chunks as they are produced, without building the
+    # whole page in memory first; stream into a temporary file and only
+    # replace publications.html once rendering succeeded, so that a
+    # failure does not leave a truncated page behind
+    template = get_template()
+    with tempfile.NamedTemporaryFile(
+        "w", dir=".", prefix=".publications", delete=False, encoding="utf-8"
+    ) as hf:
+        try:
+            template.stream(pubdata=publications).dump(hf)
+        except BaseException:
+            hf.close()
+            os.unlink(hf.name)
+            raise
+    os.replace(hf.name, "publications.html")
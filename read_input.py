@@ -1,58 +1,70 @@
 from collections import namedtuple
+import re
 
 Entry = namedtuple("Entry", ["citation", "url", "comment"], defaults=[None, None])
 
+# A run of consecutive lines that are not blank
+_BLOCK_PAT = re.compile(r"[^\n]*\S[^\n]*(?:\n[^\n]*\S[^\n]*)*")
+
 
 def read_file(fpath):
     """Read entries delimited by empty lines
 
     Lines starting with * are treated as project names. Publication
-    entries are separated by empty lines. Lines are read into a
-    "buffer" and processed once an empty line is found, or the file
-    ends.
+    entries are separated by empty lines. The file is read at once
+    and split into blocks of non-empty lines, each block being
+    processed as one entry.
 
     """
 
+    text = fpath.read_text()
     entries = dict()
-    with fpath.open("rt") as f:
-        line_buffer = []
-        project = None
-        for n, line in enumerate(f):
+    project = None
+    lineno, pos = 1, 0
+    for m in _BLOCK_PAT.finditer(text):
+        # first line of the block
+        lineno += text.count("\n", pos, m.start())
+        pos = m.start()
+
+        lines = []
+        for offset, line in enumerate(m.group().split("\n")):
             line = line.strip()
             if line.startswith("*"):
                 # project name
                 project = line.replace("*", "").lstrip()
                 if project not in entries:
                     entries[project] = []
-            elif line == "" and len(line_buffer) > 0:
-                # empty line, entry can be processed
-                # note: project=None is still a valid dict key
-                entries[project].append(process_buffer(line_buffer, n))
-                line_buffer = []
-            elif line != "":
-                # add to the buffer
-                line_buffer.append(line)
-        if len(line_buffer) > 0:
-            # clean buffer at the end
-            entries[project].append(process_buffer(line_buffer, n))
+            else:
+                if len(lines) == 0:
+                    # first line of the entry, reported in errors
+                    entry_lineno = lineno + offset
+                lines.append(line)
+        if len(lines) > 0:
+            # note: project=None is still a valid dict key
+            entries.setdefault(project, []).append(
+                process_buffer(lines, entry_lineno)
+            )
     return entries
 
 
 def process_buffer(buf, n=None):
-    if len(buf) == 1:
-        return Entry(buf)
-    elif len(buf) == 2:
-        if buf[1].startswith("http"):
-            return Entry(buf[0], url=buf[1])
-        else:
-            return Entry(buf[0], comment=buf[1])
-    elif len(buf) == 3:
-        if buf[1].startswith("http") and not buf[2].startswith("http"):
-            return Entry(buf[0], url=buf[1], comment=buf[2])
-        elif buf[2].startswith("http") and not buf[1].startswith("http"):
-            return Entry(buf[0], url=buf[2], comment=buf[1])
-        else:
-            raise ValueError(f"Found two URLs for a publication on line {n}")
-    else:
-        print(buf)
-        raise ValueError(f"Too many lines for a publication on line {n}")
+    match buf:
+        case [citation]:
+            return Entry(citation)
+        case [citation, other]:
+            if other.startswith("http"):
+                return Entry(citation, url=other)
+            else:
+                return Entry(citation, comment=other)
+        case [citation, second, third]:
+            # check each line for a url only once
+            match second.startswith("http"), third.startswith("http"):
+                case True, False:
+                    return Entry(citation, url=second, comment=third)
+                case False, True:
+                    return Entry(citation, url=third, comment=second)
+                case _:
+                    raise ValueError(f"Found two URLs for a publication on line {n}")
+        case _:
+            print(buf)
+            raise ValueError(f"Too many lines for a publication on line {n}")
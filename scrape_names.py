@@ -2,7 +2,7 @@ import argparse
 from pathlib import Path
 import re
 
-from bs4 import BeautifulSoup
+from lxml import html
 from requests_cache import CachedSession
 
 urls = [
@@ -13,21 +13,23 @@ urls = [
     "https://www.crc1451.uni-koeln.de/management-committee/",
 ]
 
-session = CachedSession("sfb_cache")
+# WAL journaling avoids an fsync on every cached response
+session = CachedSession("sfb_cache", wal=True)
 out_file = Path("sfb_authors.txt")
-proj_pat = re.compile("[ABCZ]0\d|MGK")
+proj_pat = re.compile(r"[ABCZ]0\d|MGK")
+title_pat = re.compile(r"^Dr\. ")
 
 people = []
 for url in urls:
     request = session.get(url)
-    soup = BeautifulSoup(request.text, "html.parser")
+    tree = html.fromstring(request.content)
 
-    for tag in soup.find_all("h4"):
-        x = tag.text.rstrip()
-        if len(x) == 0 or re.match(proj_pat, x):
+    for tag in tree.iter("h4"):
+        x = tag.text_content().rstrip()
+        if len(x) == 0 or proj_pat.match(x):
             pass
         else:
-            notitle = re.sub(r"^Dr\. ", "", x)
+            notitle = title_pat.sub("", x)
             people.append(notitle)
 
 # don't have to be perfect with suffixes & the like